@@ -120,9 +120,13 @@ num_list_to_string = list_list_to_string
 
 
 def version_to_tuple(version_str):
+    '''Convert the release part of version string to a tuple of ints so that versions can be
+    compared numerically. Suffixes like pre-release(2.1.0a0) and local version(2.1.0+cu118) are ignored.
+    '''
     version_tuple = tuple()
     try:
-        version_tuple = tuple(map(int, version_str.split('.')))
+        release = re.match(r'\d+(\.\d+)*', version_str).group(0)
+        version_tuple = tuple(map(int, release.split('.')))
     except Exception as e:
         ERROR('[Parser]: Cannot get version tuple for %s in version_to_tuple because %s!' % (version_str, str(e)))
     return version_tuple
@@ -2,11 +2,11 @@
 # Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
 
 
-import copy
 import os
 import numpy as np
 import math
 import itertools
+import functools
 import onnx
 import torch
 import torch.nn as nn
@@ -23,6 +23,50 @@ from ...common.defs import FLOAT_EQUAL, INT_MAX
 ONNX_OPSET_VERSION = 9
 CUSTOM_OPSET_18 = 'opset_18::'
 CUSTOM_OPSET_19 = 'opset_19::'
+# Versions of onnx and torch, which don't change during parsing
+ONNX_VERSION = str(get_version(onnx)).split('.')
+TORCH_VERSION_STR = str(torch.onnx.producer_version)
+TORCH_VERSION = version_to_tuple(TORCH_VERSION_STR)
+# Load torchvision because some models in torchvision need it. If cannot import but model needs it,
+# error will be raised after torch.jit.load.
+try:
+    import torchvision
+    TORCHVISION_VERSION = torchvision.__version__.split('+', 1)[0]
+except Exception as e:
+    DEBUG('[Parser]: Fail to import torchvision because %s!' % str(e))
+    TORCHVISION_VERSION = None
+# Cache of tensor sizes/rank/scalar type of torch values, keyed by value.unique(). The cache is only
+# valid during one export, so it's cleared before and after calling torch.onnx.export.
+_SHAPE_CACHE = {}
+_RANK_CACHE = {}
+_SCALAR_TYPE_CACHE = {}
+
+
+def _cached_sizes(value):
+    key = value.unique()
+    if key not in _SHAPE_CACHE:
+        _SHAPE_CACHE[key] = helper._get_tensor_sizes(value)
+    return _SHAPE_CACHE[key]
+
+
+def _cached_rank(value):
+    key = value.unique()
+    if key not in _RANK_CACHE:
+        _RANK_CACHE[key] = helper._get_tensor_rank(value)
+    return _RANK_CACHE[key]
+
+
+def _cached_scalar_type(value):
+    key = value.unique()
+    if key not in _SCALAR_TYPE_CACHE:
+        _SCALAR_TYPE_CACHE[key] = value.type().scalarType()
+    return _SCALAR_TYPE_CACHE[key]
+
+
+def _clear_value_caches():
+    _SHAPE_CACHE.clear()
+    _RANK_CACHE.clear()
+    _SCALAR_TYPE_CACHE.clear()
 
 
 @helper.parse_args('v')
@@ -132,7 +176,10 @@ def convert_addbmm(g, x, batch1, batch2, beta, alpha):
 
 
 def convert_add_sub(g, input, other, alpha, op_type):
-    if alpha and not FLOAT_EQUAL(helper._maybe_get_const(alpha, 'f'), 1):
+    if alpha is None or helper._is_none(alpha):
+        return g.op(op_type, input, other)
+    alpha_value = helper._maybe_get_const(alpha, 'f')
+    if helper._is_value(alpha_value) or not FLOAT_EQUAL(alpha_value, 1):
         other = g.op('Mul', other, alpha)
     return g.op(op_type, input, other)
 
@@ -188,7 +235,7 @@ def convert_argmax_argmin(g, input, dim, keepdim, op_type):
         flatten = helper._reshape_helper(g, input, [-1])
         output = g.op(op_type, flatten, axis_i=0, keepdims_i=False)
         if keepdim:
-            input_shape = helper._get_tensor_sizes(input)
+            input_shape = _cached_sizes(input)
             output_shape = np.ones_like(input_shape)
             output = helper._reshape_helper(g, output, output_shape)
     else:
@@ -234,7 +281,7 @@ def convert_bitwise_and(g, input, other):
 
 @helper.parse_args('v')
 def convert_bitwise_not(g, input):
-    if input.type().scalarType() == 'Bool':
+    if _cached_scalar_type(input) == 'Bool':
         return g.op('Not', input)
     else:
         return g.op(CUSTOM_OPSET_18 + 'BitwiseNot', input)
@@ -242,7 +289,7 @@ def convert_bitwise_not(g, input):
 
 @helper.parse_args('v', 'v')
 def convert_bitwise_or(g, input, other):
-    if input.type().scalarType() == 'Bool' and other.type().scalarType() == 'Bool':
+    if _cached_scalar_type(input) == 'Bool' and _cached_scalar_type(other) == 'Bool':
         return g.op('Or', input, other)
     else:
         return g.op(CUSTOM_OPSET_18 + 'BitwiseOr', input, other)
@@ -323,7 +370,7 @@ def convert_col2im(g, input, output_size, kernel_size, dilation, padding, stride
 def convert_conv(g, input, weight, bias, stride, padding, dilation, groups):
     # Support padding as string. Refer to https://github.com/pytorch/pytorch/pull/89107
     ret = None
-    weight_shape = helper._get_tensor_sizes(weight)
+    weight_shape = _cached_sizes(weight)
     try:
         kernel_shape = weight_shape[2:]
     except:
@@ -335,7 +382,7 @@ def convert_conv(g, input, weight, bias, stride, padding, dilation, groups):
     args = [input, weight]
     need_separate_add = False
     if not helper._is_none(bias):
-        if helper._get_tensor_rank(bias) == 1:
+        if _cached_rank(bias) == 1:
             args.append(bias)
         else:
             need_separate_add = True
@@ -444,7 +491,7 @@ def convert_fake_quantize_per_tensor_affine(g, inputs, scale, zero_point, quant_
 @helper.parse_args('v', 'i', 'i')
 @quantized_args(True, False, False)
 def convert_flatten(g, input, start_dim, end_dim):
-    input_rank = helper._get_tensor_rank(input)
+    input_rank = _cached_rank(input)
     assert input_rank is not None, 'Meets unknown rank in convert_flatten!'
     if input_rank == 0:
         return helper._reshape_helper(g, input, [1])
@@ -452,6 +499,9 @@ def convert_flatten(g, input, start_dim, end_dim):
         return g.op('Identity', input)
     start_dim = (start_dim + input_rank) if start_dim < 0 else start_dim
     end_dim = (end_dim + input_rank) if end_dim < 0 else end_dim
+    if start_dim == 0 and end_dim == input_rank - 1:
+        # Flatten all the dims to 1d
+        return helper._reshape_helper(g, input, [-1])
     return helper._flatten_helper(g, input, start_dim, end_dim, input_rank)
 
 
@@ -525,7 +575,7 @@ def convert_softshrink(g, input, lambd):
 
 
 def convert_to_bool(g, input):
-    input_dtype_str = input.type().scalarType()
+    input_dtype_str = _cached_scalar_type(input)
     if input_dtype_str != 'Bool':
         input = g.op(
             'Cast', input, to_i=torch._C._onnx.TensorProtoDataType.BOOL)
@@ -554,14 +604,16 @@ def convert_equal(g, input, other):
     '''torch equal op is different with logical equal op. It returns scalar
     True if two tensors have the same size and elements, False otherwise.
     '''
-    input_shape = helper._get_tensor_sizes(input)
-    other_shape = helper._get_tensor_sizes(other)
+    input_shape = _cached_sizes(input)
+    other_shape = _cached_sizes(other)
     if input_shape != other_shape:
         return g.op('Constant', value_t=torch.tensor(False))
-    equal = convert_logical(g, input, other, 'Equal')
-    not_equal = g.op('Not', equal)
-    reduce_sum = g.op('ReduceSum', not_equal, keepdims_i=0)
-    return g.op('Not', reduce_sum)
+    # Compare the raw values instead of using convert_logical, which casts inputs to bool
+    equal = g.op('Equal', input, other)
+    # ReduceMin of Equal is 1 only if all the elements are equal
+    equal = g.op('Cast', equal, to_i=torch._C._onnx.TensorProtoDataType.INT32)
+    reduce_min = g.op('ReduceMin', equal, keepdims_i=0)
+    return g.op('Cast', reduce_min, to_i=torch._C._onnx.TensorProtoDataType.BOOL)
 
 
 def convert_avg_pool(g, input, kernel_size, strides, paddings, ceil_mode, count_include_pad, divisor_override, dim):
@@ -740,12 +792,11 @@ def convert_max_pool(g, input, kernel_size, strides, paddings, dilations, ceil_m
                     max_pool2d if dim == 2 else max_pool3d)
         except ImportError:  # >= torch 2.1
             from torch.onnx.symbolic_opset10 import _max_pool
-            torch_version = version_to_tuple(torch.onnx.producer_version)
             max_pool_func_name = 'max_pool1d_with_indices' if dim == 1 else (
                 'max_pool2d_with_indices' if dim == 2 else 'max_pool3d_with_indices')
             cnt_param = torch.nn.modules.utils._single if dim == 1 else (
                 torch.nn.modules.utils._pair if dim == 2 else torch.nn.modules.utils._triple)
-            if torch_version >= version_to_tuple('2.2.0'):
+            if TORCH_VERSION >= version_to_tuple('2.2.0'):
                 # parameters of _max_pool changed since torch 2.2.0
                 # Refer to https://github.com/pytorch/pytorch/commit/e8e3afb784f28562aa9463da06c38b0fb574b01c
                 max_pool_func = _max_pool(max_pool_func_name, dim, return_indices=return_indices)
@@ -965,7 +1016,54 @@ def convert_quantized_cat(
         op_scale,
         op_zero_point,
 ):
+    def _maybe_get_const_through_cast(value, desc):
+        '''Same as helper._maybe_get_const, but also looks through onnx::Cast because the scale and
+        zero_point of quantized tensors are usually constants wrapped by Cast(see quantize_helper
+        and convert_quantize_per_tensor).
+        '''
+        while helper._is_value(value) and value.node().kind() == 'onnx::Cast':
+            value = value.node().input()
+        return helper._maybe_get_const(value, desc)
+
+    def _get_qlinear_concat_inputs(unpacked_inputs, out_scale, out_zero_point):
+        '''Return the inputs of QLinearConcat(x, x_scale, x_zero_point for each input) if all
+        the inputs are quantized per tensor with the same constant scale and zero_point of
+        output. Otherwise, return None.
+        '''
+        if helper._is_value(out_scale) or helper._is_value(out_zero_point):
+            return None
+        qlinear_inputs = []
+        for input in unpacked_inputs:
+            unpacked_qtensor = helper._unpack_tuple(input)
+            if len(unpacked_qtensor) > 3 and not helper._is_none(unpacked_qtensor[3]):
+                return None
+            q_tensor, scale, zero_point = unpacked_qtensor[:3]
+            scale_value = _maybe_get_const_through_cast(scale, 'f')
+            zero_point_value = _maybe_get_const_through_cast(zero_point, 'i')
+            if helper._is_value(scale_value) or helper._is_value(zero_point_value) \
+                    or not FLOAT_EQUAL(scale_value, out_scale) or zero_point_value != out_zero_point:
+                return None
+            qlinear_inputs.extend([q_tensor, scale, zero_point])
+        return qlinear_inputs
+
     unpacked_inputs = helper._unpack_list(q_inputs)
+    out_scale = _maybe_get_const_through_cast(op_scale, 'f')
+    out_zero_point = _maybe_get_const_through_cast(op_zero_point, 'i')
+    qlinear_inputs = _get_qlinear_concat_inputs(unpacked_inputs, out_scale, out_zero_point)
+    if qlinear_inputs:
+        # All the inputs and output share the same scale and zero_point, so convert to
+        # QLinearConcat to avoid inserting DequantizeLinear/QuantizeLinear for each input.
+        # The scale and zero_point of the first input are used because they have the
+        # expected dtype of output.
+        y_scale, y_zero_point = qlinear_inputs[1:3]
+        concatenated = g.op('com.microsoft::QLinearConcat', y_scale, y_zero_point, *qlinear_inputs, axis_i=dim)
+        q_tensors = qlinear_inputs[0::3]
+        input_sizes = [helper._get_tensor_sizes(q_tensor) for q_tensor in q_tensors]
+        if all(sizes is not None and None not in sizes for sizes in input_sizes):
+            output_sizes = list(input_sizes[0])
+            output_sizes[dim] = sum(sizes[dim] for sizes in input_sizes)
+            concatenated.setType(q_tensors[0].type().with_sizes(output_sizes))
+        return g.op('prim::TupleConstruct', concatenated, y_scale, y_zero_point)
     dequantized = [
         helper.dequantize_helper(g, input)[0] for input in unpacked_inputs
     ]
@@ -1703,126 +1801,11 @@ def convert_atan2(g, self, other):
     return result
 
 
-def convert_torch_to_onnx(model_path, params):
-    def _export_to_onnx(model,
-                        input_tensors,
-                        onnx_model_path,
-                        input_names,
-                        output_names,
-                        onnx_opset_version=None,
-                        do_constant_folding=True):
-        custom_opsets = {'opset_11': 11}
-        if onnx_opset_version is not None:
-            if onnx_opset_version < 18:
-                custom_opsets.update({'opset_18': 18, 'opset_19': 19})
-            elif onnx_opset_version == 18:
-                custom_opsets.update({'opset_19': 19})
-        # Note: Use operator_export_type=torch.onnx.OperatorExportTypes.ONNX_ATEN_FALLBACK
-        # or torch.onnx.OperatorExportTypes.ONNX_ATEN for debug if export fails.
-        # The failure could be caused by unexpected input shapes.
-        torch.onnx.export(model,
-                          input_tensors,
-                          onnx_model_path,
-                          input_names=input_names,
-                          output_names=output_names,
-                          opset_version=onnx_opset_version,
-                          training=torch.onnx.TrainingMode.PRESERVE,
-                          custom_opsets=custom_opsets,
-                          do_constant_folding=do_constant_folding)
-        return
-
-    def _flatten_type(torch_type):
-        output_types = []
-        if isinstance(torch_type, torch._C.TupleType):
-            for nested_out in torch_type.elements():
-                output_types.extend(_flatten_type(nested_out))
-        else:
-            output_types.append(torch_type)
-        return output_types
-
-    # Check whether inputs and shapes are provided. They must be provided because we cannot get input
-    # shapes info from the provided model.
-    if not params['input_shapes']:
-        FATAL('[Parser]: Input names and shapes must be provided in config file for TorchScript model!')
-
-    # Load torchvision because some models in torchvision need it. If cannot import but model needs it,
-    # error will be raised after torch.jit.load.
-    try:
-        import torchvision
-        torchvision_version = torchvision.__version__.split('+', 1)[0]
-    except Exception as e:
-        DEBUG('[Parser]: Fail to import torchvision because %s!' % str(e))
-        torchvision_version = None
-
-    # Load TorchScript/non-TorchScript model
-    is_torch_script_model = False
-    force_cpu = params.get('force_cpu', False)
-    is_cuda_available = torch.cuda.is_available()
-    use_gpu = is_cuda_available and (not force_cpu)
-    if force_cpu:
-        device = 'cpu'
-    else:
-        device = 'cuda' if is_cuda_available else 'cpu'
-    WARN('[Parser]: In pytorch %s mode now. Please check \'force_cpu\' in config file and confirm whether your model is created in the same mode!' % device.upper())
-
-    try:
-        model = torch.jit.load(model_path, map_location=torch.device(device))
-        is_torch_script_model = True
-    except RuntimeError:
-        try:
-            model = torch.load(model_path, map_location=torch.device(device))
-            if isinstance(model, torch.nn.Module):
-                model.eval()
-            else:
-                FATAL('[Parser]: The Model is neither a TorchScript pt nor a nn.Module, please provide valid file!')
-        except Exception as e:
-            FATAL('[Parser]: Fail to load model (%s) because %s!' % (model_path, str(e)))
-    except Exception as e:
-        FATAL('[Parser]: Fail to load model (%s) because %s!' % (model_path, str(e)))
-
-    # Get onnx opset version to target
-    # From https://onnxruntime.ai/docs/reference/compatibility.html,
-    # for onnx version 1.x, onnx opset version=x+5
-    onnx_version = str(get_version(onnx)).split('.')
-    onnx_opset_version = (
-        int(onnx_version[-1]) + 5) if int(onnx_version[0]) == 1 else None
-    torch_version_str = str(torch.onnx.producer_version)
-    torch_version = version_to_tuple(torch_version_str)
-    if onnx_opset_version is not None:
-        default_onnx_main_opset = None
-        default_onnx_stable_opsets = []
-        try:
-            if torch_version_str.startswith('1.11'):
-                default_onnx_main_opset = helper._onnx_main_opset
-                default_onnx_stable_opsets = helper._onnx_stable_opsets
-            elif torch_version >= version_to_tuple('1.13.0'):
-                import torch.onnx._constants as Constant
-                default_onnx_main_opset = Constant.ONNX_DEFAULT_OPSET
-                default_onnx_stable_opsets = list(range(Constant.ONNX_MIN_OPSET, Constant.ONNX_MAX_OPSET + 1))
-            elif torch_version >= version_to_tuple('1.12.0'):
-                import torch.onnx._constants as Constant
-                default_onnx_main_opset = Constant.onnx_main_opset
-                default_onnx_stable_opsets = Constant.onnx_stable_opsets
-        except Exception as e:
-            DEBUG(
-                '[Parser]: Fail to get default onnx opset version because %s' % str(e))
-        if default_onnx_main_opset is None:
-            onnx_opset_version = None
-        elif onnx_opset_version >= default_onnx_main_opset or onnx_opset_version not in default_onnx_stable_opsets:
-            onnx_opset_version = default_onnx_main_opset
-    if onnx_opset_version is None:
-        onnx_opset_version = 9
-    global ONNX_OPSET_VERSION, CUSTOM_OPSET_18, CUSTOM_OPSET_19
-    ONNX_OPSET_VERSION = onnx_opset_version
-    CUSTOM_OPSET_18 = '' if onnx_opset_version >= 18 else CUSTOM_OPSET_18
-    CUSTOM_OPSET_19 = '' if onnx_opset_version >= 19 else CUSTOM_OPSET_19
-    if onnx_opset_version < 17:
-        WARN('[Parser]: Default onnx opset version (%d) is lower than 17, which may cause some ops failed to convert!' %
-             onnx_opset_version)
-    else:
-        DEBUG('[Parser]: Will convert to onnx opset version (%d)!' %
-              onnx_opset_version)
-
+@functools.lru_cache(maxsize=4)
+def _register_custom_symbolics(onnx_opset_version, torch_version, torchvision_version):
+    '''Register the symbolic functions that don't depend on the model. Registering only
+    needs to be done once for the same versions, so the result is cached.
+    '''
     # Convert torch op to non-custom onnx op
     if torch_version < version_to_tuple('2.0.1'):
         # The issue of argmax/argmin is fixed in torch 2.0.1.
@@ -1844,10 +1827,6 @@ def convert_torch_to_onnx(model_path, params):
         torch.onnx.register_custom_op_symbolic(
             'aten::t', convert_t, onnx_opset_version)
     if torch_version < version_to_tuple('2.1.0'):
-        # The issue of training is fixed in latest torch.
-        # Refer to https://github.com/pytorch/pytorch/pull/86745
-        if not hasattr(model, 'training'):
-            model.training = False
         # The issue of string padding is fixed in latest torch.
         # Refer to https://github.com/pytorch/pytorch/pull/89107
         for conv_op in ('aten::conv1d', 'aten::conv2d', 'aten::conv3d'):
@@ -2050,14 +2029,6 @@ def convert_torch_to_onnx(model_path, params):
     torch.onnx.register_custom_op_symbolic(
         'aten::quantize_per_tensor', convert_quantize_per_tensor, onnx_opset_version)
 
-    if is_torch_script_model:
-        model_output_names = [out.debugName() for out in model.graph.outputs()]
-        # Only convert prim::DictConstruct to Identity when it's output node.
-        dict_nodes = model.graph.findAllNodes('prim::DictConstruct')
-        if dict_nodes and all(node.output().debugName() in model_output_names for node in dict_nodes):
-            torch.onnx.register_custom_op_symbolic(
-                'prim::DictConstruct', convert_dict_construct, onnx_opset_version)
-
     # Convert torch op to custom onnx op
     torch.onnx.register_custom_op_symbolic(
         'aten::adaptive_avg_pool1d', convert_adaptive_avg_pool1d, onnx_opset_version)
@@ -2078,17 +2049,161 @@ def convert_torch_to_onnx(model_path, params):
 
     # Convert torchvision op
     if torchvision_version is not None:
-        if torchvision_version < '0.15.0':
+        if version_to_tuple(torchvision_version) < version_to_tuple('0.15.0'):
             # The issue of align=True of RoiAlign has been fixed since torchvision 0.15.0.
             # Refer to https://github.com/pytorch/vision/pull/6685
             torch.onnx.register_custom_op_symbolic(
                 'torchvision::roi_align', convert_roi_align, onnx_opset_version)
 
+
+def convert_torch_to_onnx(model_path, params):
+    def _export_to_onnx(model,
+                        input_tensors,
+                        onnx_model_path,
+                        input_names,
+                        output_names,
+                        onnx_opset_version=None,
+                        do_constant_folding=True):
+        custom_opsets = {'opset_11': 11}
+        if onnx_opset_version is not None:
+            if onnx_opset_version < 18:
+                custom_opsets.update({'opset_18': 18, 'opset_19': 19})
+            elif onnx_opset_version == 18:
+                custom_opsets.update({'opset_19': 19})
+        # Note: Use operator_export_type=torch.onnx.OperatorExportTypes.ONNX_ATEN_FALLBACK
+        # or torch.onnx.OperatorExportTypes.ONNX_ATEN for debug if export fails.
+        # The failure could be caused by unexpected input shapes.
+        export_kwargs = {}
+        if TORCH_VERSION >= version_to_tuple('2.5.0'):
+            # The symbolic functions registered above only work with the TorchScript-based exporter.
+            export_kwargs.update({'dynamo': False})
+        try:
+            torch.onnx.export(model,
+                              input_tensors,
+                              onnx_model_path,
+                              input_names=input_names,
+                              output_names=output_names,
+                              opset_version=onnx_opset_version,
+                              training=torch.onnx.TrainingMode.PRESERVE,
+                              custom_opsets=custom_opsets,
+                              do_constant_folding=do_constant_folding,
+                              **export_kwargs)
+        finally:
+            _clear_value_caches()
+        return
+
+    def _flatten_type(torch_type):
+        output_types = []
+        type_stack = [torch_type]
+        while type_stack:
+            cur_type = type_stack.pop()
+            if isinstance(cur_type, torch._C.TupleType):
+                # Push in reversed order so that elements are popped in original order
+                type_stack.extend(reversed(cur_type.elements()))
+            else:
+                output_types.append(cur_type)
+        return output_types
+
+    _clear_value_caches()
+
+    # Check whether inputs and shapes are provided. They must be provided because we cannot get input
+    # shapes info from the provided model.
+    if not params['input_shapes']:
+        FATAL('[Parser]: Input names and shapes must be provided in config file for TorchScript model!')
+
+    # Load TorchScript/non-TorchScript model
+    is_torch_script_model = False
+    force_cpu = params.get('force_cpu', False)
+    is_cuda_available = torch.cuda.is_available()
+    use_gpu = is_cuda_available and (not force_cpu)
+    if force_cpu:
+        device = 'cpu'
+    else:
+        device = 'cuda' if is_cuda_available else 'cpu'
+    WARN('[Parser]: In pytorch %s mode now. Please check \'force_cpu\' in config file and confirm whether your model is created in the same mode!' % device.upper())
+
+    try:
+        model = torch.jit.load(model_path, map_location=torch.device(device))
+        is_torch_script_model = True
+    except RuntimeError:
+        try:
+            model = torch.load(model_path, map_location=torch.device(device))
+            if isinstance(model, torch.nn.Module):
+                model.eval()
+            else:
+                FATAL('[Parser]: The Model is neither a TorchScript pt nor a nn.Module, please provide valid file!')
+        except Exception as e:
+            FATAL('[Parser]: Fail to load model (%s) because %s!' % (model_path, str(e)))
+    except Exception as e:
+        FATAL('[Parser]: Fail to load model (%s) because %s!' % (model_path, str(e)))
+
+    # Get onnx opset version to target
+    # From https://onnxruntime.ai/docs/reference/compatibility.html,
+    # for onnx version 1.x, onnx opset version=x+5
+    onnx_opset_version = (
+        int(ONNX_VERSION[-1]) + 5) if int(ONNX_VERSION[0]) == 1 else None
+    torch_version_str = TORCH_VERSION_STR
+    torch_version = TORCH_VERSION
+    if onnx_opset_version is not None:
+        default_onnx_main_opset = None
+        default_onnx_stable_opsets = []
+        try:
+            if torch_version_str.startswith('1.11'):
+                default_onnx_main_opset = helper._onnx_main_opset
+                default_onnx_stable_opsets = helper._onnx_stable_opsets
+            elif torch_version >= version_to_tuple('1.13.0'):
+                import torch.onnx._constants as Constant
+                default_onnx_main_opset = Constant.ONNX_DEFAULT_OPSET
+                default_onnx_stable_opsets = list(range(Constant.ONNX_MIN_OPSET, Constant.ONNX_MAX_OPSET + 1))
+            elif torch_version >= version_to_tuple('1.12.0'):
+                import torch.onnx._constants as Constant
+                default_onnx_main_opset = Constant.onnx_main_opset
+                default_onnx_stable_opsets = Constant.onnx_stable_opsets
+        except Exception as e:
+            DEBUG(
+                '[Parser]: Fail to get default onnx opset version because %s' % str(e))
+        if default_onnx_main_opset is None:
+            onnx_opset_version = None
+        elif onnx_opset_version >= default_onnx_main_opset or onnx_opset_version not in default_onnx_stable_opsets:
+            onnx_opset_version = default_onnx_main_opset
+    if onnx_opset_version is None:
+        onnx_opset_version = 9
+    global ONNX_OPSET_VERSION, CUSTOM_OPSET_18, CUSTOM_OPSET_19
+    ONNX_OPSET_VERSION = onnx_opset_version
+    CUSTOM_OPSET_18 = '' if onnx_opset_version >= 18 else CUSTOM_OPSET_18
+    CUSTOM_OPSET_19 = '' if onnx_opset_version >= 19 else CUSTOM_OPSET_19
+    if onnx_opset_version < 17:
+        WARN('[Parser]: Default onnx opset version (%d) is lower than 17, which may cause some ops failed to convert!' %
+             onnx_opset_version)
+    else:
+        DEBUG('[Parser]: Will convert to onnx opset version (%d)!' %
+              onnx_opset_version)
+
+    if torch_version < version_to_tuple('2.1.0'):
+        # The issue of training is fixed in latest torch.
+        # Refer to https://github.com/pytorch/pytorch/pull/86745
+        if not hasattr(model, 'training'):
+            model.training = False
+
+    _register_custom_symbolics(onnx_opset_version, torch_version, TORCHVISION_VERSION)
+
+    if is_torch_script_model:
+        model_output_names = [out.debugName() for out in model.graph.outputs()]
+        # Only convert prim::DictConstruct to Identity when it's output node.
+        dict_nodes = model.graph.findAllNodes('prim::DictConstruct')
+        if dict_nodes and all(node.output().debugName() in model_output_names for node in dict_nodes):
+            torch.onnx.register_custom_op_symbolic(
+                'prim::DictConstruct', convert_dict_construct, onnx_opset_version)
+
     # Get input_tensors and input_names
-    input_names = []
-    tensor_list = []
-    input_info_dict = copy.deepcopy(params['input_shapes'])
+    input_info_dict = params['input_shapes']
+    input_names = [None] * len(input_info_dict)
+    tensor_list = [None] * len(input_info_dict)
+    # Build a new dict for renamed inputs so that the order of inputs is kept
+    sanitized_input_shapes = {}
     input_dtype = params['input_dtype']
+    # Dummy inputs are not needed if inputs are provided by similarity_input_npy
+    use_similarity_input = params.get('similarity_input_npy') != {}
     for idx, (input_name, input_shape) in enumerate(input_info_dict.items()):
         # Starting with numbers is not legal in pytorch
         if len(input_name) >= 1 and input_name[0].isdigit():
@@ -2097,10 +2212,9 @@ def convert_torch_to_onnx(model_path, params):
                  (input_name, new_input_name))
             if input_name in params.get('input_tensor_map', {}):
                 params['input_tensor_map'][input_name] = new_input_name
-            params['input_shapes'].pop(input_name)
-            params['input_shapes'][new_input_name] = input_shape
             input_name = new_input_name
-        input_names.append(input_name)
+        sanitized_input_shapes[input_name] = input_shape
+        input_names[idx] = input_name
         assert len(
             input_dtype) > idx, 'Meets invalid input_dtype in convert_torch_to_onnx'
         try:
@@ -2111,15 +2225,15 @@ def convert_torch_to_onnx(model_path, params):
             tensor_dtype = torch.float32
             WARN('[Parser]: Input dtype %s is changed to float32 because %s' %
                  (input_dtype[idx], str(e)))
-        if 'float' in str(tensor_dtype):
-            tensor = torch.randn(input_shape, dtype=tensor_dtype)
-        else:
-            tensor = torch.zeros(input_shape, dtype=tensor_dtype)
-        if use_gpu:
-            tensor = tensor.cuda()
-        tensor_list.append(tensor)
-
-    if params.get('similarity_input_npy') != {}:
+        if use_similarity_input:
+            continue
+        # The values of dummy inputs don't matter for exporting, so don't fill them with random data.
+        # Use ones for float inputs to avoid nan/inf and zeros for others to keep them valid as indices.
+        fill_func = torch.ones if tensor_dtype.is_floating_point else torch.zeros
+        tensor_list[idx] = fill_func(input_shape, dtype=tensor_dtype, device=device)
+    params['input_shapes'] = sanitized_input_shapes
+
+    if use_similarity_input:
         tensor_list = []
         inp_npy = params.get('similarity_input_npy')
         for k, v in input_info_dict.items():
@@ -2143,6 +2257,8 @@ def convert_torch_to_onnx(model_path, params):
     output_names = []
     for out_idx, out in enumerate(jit_model.graph.outputs()):
         out_name = out.debugName() + '_' + str(out_idx) + '_'
+        if out_name[0].isdigit():
+            out_name = 'output_' + out_name
         if isinstance(out.type(), torch._C.DictType):
             inputs_num = len([inp for inp in out.node().inputs()])
             outputs_num = inputs_num // 2
@@ -2150,9 +2266,6 @@ def convert_torch_to_onnx(model_path, params):
             outputs_num = len(_flatten_type(out.type()))
         output_names.extend([out_name + str(idx)
                              for idx in range(outputs_num)])
-    for idx, output_name in enumerate(output_names):
-        if output_name[0].isdigit():
-            output_names[idx] = 'output_' + output_name
 
     # Get the file name of the onnx model to be exported
     onnx_model_path = os.path.join(params.get('output_dir', './'),
@@ -2176,47 +2289,58 @@ def convert_torch_to_onnx(model_path, params):
     else:
 
         # Call torch.onnx.export to convert TorchScript model to onnx model
-        exit_code = 1
-        try:
-            # Fix hangs issue by set_num_threads if multiprocessing is used.
-            # Refer to https://github.com/pytorch/pytorch/issues/36191
-            torch.set_num_threads(1)
-            # Uncomment the following line to debug this code and torch.onnx.export:
-            # _export_to_onnx(model, input_tensors, onnx_model_path, input_names, output_names, onnx_opset_version)
-            # exit_code = 0
-            process = Process(target=_export_to_onnx, args=(model,
-                                                            input_tensors,
-                                                            onnx_model_path,
-                                                            input_names,
-                                                            output_names,
-                                                            onnx_opset_version))
-            process.start()
-            process.join()
-            exit_code = process.exitcode
+        if os.environ.get('AIPU_PARSER_EXPORT_SUBPROC', '0') == '1':
+            exit_code = 1
             try:
-                process.close()
+                # Fix hangs issue by set_num_threads if multiprocessing is used.
+                # Refer to https://github.com/pytorch/pytorch/issues/36191
+                torch.set_num_threads(1)
+                process = Process(target=_export_to_onnx, args=(model,
+                                                                input_tensors,
+                                                                onnx_model_path,
+                                                                input_names,
+                                                                output_names,
+                                                                onnx_opset_version))
+                process.start()
+                process.join()
+                exit_code = process.exitcode
+                try:
+                    process.close()
+                except Exception as e:
+                    DEBUG('[Parser]: Fail to close process because %s' % str(e))
             except Exception as e:
-                DEBUG('[Parser]: Fail to close process because %s' % str(e))
-        except Exception as e:
-            FATAL('[Parser]: Fail to convert model (%s) to onnx because %s' %
-                  (model_path, str(e)))
+                FATAL('[Parser]: Fail to convert model (%s) to onnx because %s' %
+                      (model_path, str(e)))
 
-        if exit_code != 0:
-            FATAL(
-                '[Parser]: Fail to convert model (%s) to onnx! Suggest to set env var PYTORCH_JIT_LOG_LEVEL=onnx for debug!' % model_path)
+            if exit_code != 0:
+                FATAL(
+                    '[Parser]: Fail to convert model (%s) to onnx! Suggest to set env var PYTORCH_JIT_LOG_LEVEL=onnx for debug!' % model_path)
+        else:
+            # Export in current process to avoid the cost of forking and re-importing torch. Set env var
+            # AIPU_PARSER_EXPORT_SUBPROC=1 to export in a subprocess instead.
+            prev_num_threads = torch.get_num_threads()
+            try:
+                torch.set_num_threads(1)
+                _export_to_onnx(model, input_tensors, onnx_model_path,
+                                input_names, output_names, onnx_opset_version)
+            except Exception as e:
+                FATAL('[Parser]: Fail to convert model (%s) to onnx because %s! Suggest to set env var '
+                      'PYTORCH_JIT_LOG_LEVEL=onnx for debug!' % (model_path, str(e)))
+            finally:
+                torch.set_num_threads(prev_num_threads)
 
     INFO('[Parser]: Torch model has been converted to onnx model (%s) with opset version (%d)!' %
          (onnx_model_path, 'default' if onnx_opset_version is None else onnx_opset_version))
 
     # Update params
-    updated_params = copy.deepcopy(params)
-    updated_params.update({'input_model': onnx_model_path,
-                           'original_input_model': model_path,
-                           'input_names': input_names,
-                           'input_shapes': params['input_shapes'],
-                           'output_names': [],
-                           'output_tensor_names': output_names,
-                           'model_type': 'torch'})
+    updated_params = {**params,
+                      'input_model': onnx_model_path,
+                      'original_input_model': model_path,
+                      'input_names': input_names,
+                      'input_shapes': params['input_shapes'],
+                      'output_names': [],
+                      'output_tensor_names': output_names,
+                      'model_type': 'torch'}
 
     # Return onnx model path and updated params
     return onnx_model_path, updated_params
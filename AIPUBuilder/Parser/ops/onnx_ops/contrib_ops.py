@@ -6,7 +6,21 @@ from ..op import *
 import numpy as np
 
 
+_IINFO_CACHE = {}
+
+
+def _get_iinfo_range(dtype):
+    '''Return the (min, max) of an integer dtype, which is cached because np.iinfo is slow.'''
+    if dtype not in _IINFO_CACHE:
+        info = np.iinfo(dtype)
+        _IINFO_CACHE[dtype] = (info.min, info.max)
+    return _IINFO_CACHE[dtype]
+
+
 class QGemmMsOp(OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'A': 0, 'a_scale': 1, 'a_zero_point': 2, 'B': 3, 'b_scale': 4,
+                  'b_zero_point': 5, 'C': 6, 'y_scale': 7, 'y_zero_point': 8}
+
     @classmethod
     def attributes(cls):
         return {1: {'alpha': {'type': AttrType.FLOAT, 'default': 1.0},
@@ -24,10 +38,8 @@ class QGemmMsOp(OpHasOneOutPort, OnnxOp):
         except:
             ret = None
         try:
-            input_names = ['A', 'a_scale', 'a_zero_point', 'B',
-                           'b_scale', 'b_zero_point', 'C', 'y_scale', 'y_zero_point']
-            if item in input_names:
-                item_idx = input_names.index(item)
+            item_idx = QGemmMsOp._INPUT_IDX.get(item, None)
+            if item_idx is not None:
                 inputs = self.get_input_tensors()
                 if len(inputs) > item_idx:
                     ret = inputs[item_idx]
@@ -67,6 +79,9 @@ class QGemmMsOp(OpHasOneOutPort, OnnxOp):
 
 
 class QLinearAddMsOp(OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'A': 0, 'A_scale': 1, 'A_zero_point': 2, 'B': 3,
+                  'B_scale': 4, 'B_zero_point': 5, 'C_scale': 6, 'C_zero_point': 7}
+
     @classmethod
     def attributes(cls):
         return {1: {}}
@@ -76,47 +91,85 @@ class QLinearAddMsOp(OpHasOneOutPort, OnnxOp):
         self.update_attributes(QLinearAddMsOp, attr_dict)
         assert self.check_required(), 'QLinearAddMsOp is missing a required parameter.'
 
-    def __getattr__(self, item):
-        try:
-            ret = self.__dict__['_attr'][item].value
-        except:
-            ret = None
-        try:
-            if ret is None:
-                input_names = ['A', 'A_scale', 'A_zero_point', 'B',
-                               'B_scale', 'B_zero_point', 'C_scale', 'C_zero_point']
-                if item in input_names:
-                    item_idx = input_names.index(item)
-                    inputs = self.get_input_tensors()
-                    if len(inputs) > item_idx:
-                        ret = inputs[item_idx]
-                        if 'scale' in item:
-                            ret = np.array(ret).astype(np.float32)
-                        self.__dict__['_attr'][item] = Attribute(item, {'type': AttrType.TENSOR, 'value': ret})
-                if ret is None and item in ('A_zero_point', 'B_zero_point', 'C_zero_point') and self.A is not None:
-                    ret = np.array(0, dtype=self.A.dtype)
-                    self.__dict__['_attr'][item] = Attribute(item, {'type': AttrType.TENSOR, 'value': ret})
-        except:
-            ret = None
+    def _get_input(self, item):
+        '''Get the input tensor by name. The tensor is cached in _attr after the first access.'''
+        attr = self.__dict__['_attr'].get(item, None)
+        ret = attr.value if attr is not None else None
         if ret is None:
-            ret = super(QLinearAddMsOp, self).__getattr__(item)
+            item_idx = QLinearAddMsOp._INPUT_IDX[item]
+            inputs = self.get_input_tensors() or []
+            if len(inputs) > item_idx:
+                ret = inputs[item_idx]
+                if 'scale' in item:
+                    ret = np.asarray(ret, dtype=np.float32)
+                self.__dict__['_attr'][item] = Attribute(item, {'type': AttrType.TENSOR, 'value': ret})
+            if ret is None and item.endswith('_zero_point'):
+                input_a = self._get_input('A')
+                if input_a is not None:
+                    ret = np.array(0, dtype=input_a.dtype)
+                    self.__dict__['_attr'][item] = Attribute(item, {'type': AttrType.TENSOR, 'value': ret})
         return ret
 
+    @property
+    def A(self):
+        return self._get_input('A')
+
+    @property
+    def A_scale(self):
+        return self._get_input('A_scale')
+
+    @property
+    def A_zero_point(self):
+        return self._get_input('A_zero_point')
+
+    @property
+    def B(self):
+        return self._get_input('B')
+
+    @property
+    def B_scale(self):
+        return self._get_input('B_scale')
+
+    @property
+    def B_zero_point(self):
+        return self._get_input('B_zero_point')
+
+    @property
+    def C_scale(self):
+        return self._get_input('C_scale')
+
+    @property
+    def C_zero_point(self):
+        return self._get_input('C_zero_point')
+
     def infer_shape(self):
         super(QLinearAddMsOp, self).infer_shape()
         inputs = self.get_input_tensors()
         assert len(inputs) >= 7, 'Meets invalid inputs length of QLinearAddMs op (%s)' % self.name
-        float_a = (self.A.astype(np.int32) - self.A_zero_point) * self.A_scale
-        float_b = (self.B.astype(np.int32) - self.B_zero_point) * self.B_scale
-        float_y = np.add(float_a, float_b)
-        out_min = np.iinfo(self.C_zero_point.dtype).min
-        out_max = np.iinfo(self.C_zero_point.dtype).max
-        out_tensor = np.clip(np.around(float_y / self.C_scale) + self.C_zero_point,
-                             out_min, out_max).astype(self.C_zero_point.dtype)
+        A, A_scale, A_zero_point, B, B_scale, B_zero_point, C_scale, C_zero_point = (
+            self.A, self.A_scale, self.A_zero_point, self.B, self.B_scale, self.B_zero_point,
+            self.C_scale, self.C_zero_point)
+        # Compute in two preallocated float32 buffers to avoid creating temporaries of the whole tensor.
+        out_shape = np.broadcast_shapes(A.shape, B.shape)
+        float_y = np.empty(out_shape, dtype=np.float32)
+        float_b = np.empty(out_shape, dtype=np.float32)
+        np.subtract(A, A_zero_point, out=float_y, dtype=np.float32)
+        np.multiply(float_y, np.asarray(A_scale, dtype=np.float32), out=float_y)
+        np.subtract(B, B_zero_point, out=float_b, dtype=np.float32)
+        np.multiply(float_b, np.asarray(B_scale, dtype=np.float32), out=float_b)
+        np.add(float_y, float_b, out=float_y)
+        np.divide(float_y, np.asarray(C_scale, dtype=np.float32), out=float_y)
+        np.around(float_y, out=float_y)
+        np.add(float_y, C_zero_point, out=float_y, dtype=np.float32)
+        out_min, out_max = _get_iinfo_range(C_zero_point.dtype)
+        np.clip(float_y, out_min, out_max, out=float_y)
+        out_tensor = float_y.astype(C_zero_point.dtype)
         self.set_out_tensor(out_tensor)
 
 
 class QLinearAveragePoolMsOp(BaseOnnxPoolOp, OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'x': 0, 'x_scale': 1, 'x_zero_point': 2, 'y_scale': 3, 'y_zero_point': 4}
+
     @classmethod
     def attributes(cls):
         return {1: {'channels_last': {'type': AttrType.INT, 'default': 0},
@@ -136,9 +189,8 @@ class QLinearAveragePoolMsOp(BaseOnnxPoolOp, OpHasOneOutPort, OnnxOp):
         except:
             ret = None
         try:
-            input_names = ['x', 'x_scale', 'x_zero_point', 'y_scale', 'y_zero_point']
-            if item in input_names:
-                item_idx = input_names.index(item)
+            item_idx = QLinearAveragePoolMsOp._INPUT_IDX.get(item, None)
+            if item_idx is not None:
                 inputs = self.get_input_tensors()
                 if len(inputs) > item_idx:
                     ret = inputs[item_idx]
@@ -220,6 +272,8 @@ class QLinearAveragePoolMsOp(BaseOnnxPoolOp, OpHasOneOutPort, OnnxOp):
 
 
 class QLinearConcatMsOp(OpHasAxis, OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'y_scale': 0, 'y_zero_point': 1}
+
     @classmethod
     def attributes(cls):
         return {
@@ -232,9 +286,8 @@ class QLinearConcatMsOp(OpHasAxis, OpHasOneOutPort, OnnxOp):
         except:
             ret = None
         try:
-            input_names = ['y_scale', 'y_zero_point']
-            if item in input_names:
-                item_idx = input_names.index(item)
+            item_idx = QLinearConcatMsOp._INPUT_IDX.get(item, None)
+            if item_idx is not None:
                 inputs = self.get_input_tensors()
                 if len(inputs) > item_idx:
                     ret = inputs[item_idx]
@@ -272,6 +325,8 @@ class QLinearConcatMsOp(OpHasAxis, OpHasOneOutPort, OnnxOp):
 
 
 class QLinearGlobalAveragePoolMsOp(OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'x': 0, 'x_scale': 1, 'x_zero_point': 2, 'y_scale': 3, 'y_zero_point': 4}
+
     @classmethod
     def attributes(cls):
         return {1: {'channels_last': {'type': AttrType.INT, 'required': True}}}
@@ -287,9 +342,8 @@ class QLinearGlobalAveragePoolMsOp(OpHasOneOutPort, OnnxOp):
         except:
             ret = None
         try:
-            input_names = ['x', 'x_scale', 'x_zero_point', 'y_scale', 'y_zero_point']
-            if item in input_names:
-                item_idx = input_names.index(item)
+            item_idx = QLinearGlobalAveragePoolMsOp._INPUT_IDX.get(item, None)
+            if item_idx is not None:
                 inputs = self.get_input_tensors()
                 if len(inputs) > item_idx:
                     ret = inputs[item_idx]
@@ -320,6 +374,8 @@ class QLinearGlobalAveragePoolMsOp(OpHasOneOutPort, OnnxOp):
 
 
 class QLinearLeakyReluMsOp(OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'X': 0, 'X_scale': 1, 'X_zero_point': 2, 'Y_scale': 3, 'Y_zero_point': 4}
+
     @classmethod
     def attributes(cls):
         return {1: {'alpha': {'type': AttrType.FLOAT, 'default': 0.01}}}
@@ -336,9 +392,8 @@ class QLinearLeakyReluMsOp(OpHasOneOutPort, OnnxOp):
             ret = None
         try:
             if ret is None:
-                input_names = ['X', 'X_scale', 'X_zero_point', 'Y_scale', 'Y_zero_point']
-                if item in input_names:
-                    item_idx = input_names.index(item)
+                item_idx = QLinearLeakyReluMsOp._INPUT_IDX.get(item, None)
+                if item_idx is not None:
                     inputs = self.get_input_tensors()
                     if len(inputs) > item_idx:
                         ret = inputs[item_idx]
@@ -365,6 +420,8 @@ class QLinearLeakyReluMsOp(OpHasOneOutPort, OnnxOp):
 
 
 class QLinearSigmoidMsOp(OpHasOneOutPort, OnnxOp):
+    _INPUT_IDX = {'X': 0, 'X_scale': 1, 'X_zero_point': 2, 'Y_scale': 3, 'Y_zero_point': 4}
+
     @classmethod
     def attributes(cls):
         return {1: {}}
@@ -381,9 +438,8 @@ class QLinearSigmoidMsOp(OpHasOneOutPort, OnnxOp):
             ret = None
         try:
             if ret is None:
-                input_names = ['X', 'X_scale', 'X_zero_point', 'Y_scale', 'Y_zero_point']
-                if item in input_names:
-                    item_idx = input_names.index(item)
+                item_idx = QLinearSigmoidMsOp._INPUT_IDX.get(item, None)
+                if item_idx is not None:
                     inputs = self.get_input_tensors()
                     if len(inputs) > item_idx:
                         ret = inputs[item_idx]
@@ -0,0 +1,39 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+import torch
+import numpy as np
+from utils.run import run_parser
+
+
+class equal_model(torch.nn.Module):
+    def __init__(self):
+        super(equal_model, self).__init__()
+
+    def forward(self, x1, x2):
+        return torch.equal(x1, x2)
+
+
+def create_equal_model(model_path):
+    try:
+        model = equal_model()
+        model_scripted = torch.jit.script(model)
+        model_scripted.save(model_path)
+    except Exception as e:
+        print('Fail to create torch model because %s' % str(e))
+
+
+TEST_NAME = 'equal'
+
+for input_shape in ([], [3, 4], ):
+    model_path = '-'.join([TEST_NAME, str(len(input_shape))]) + '.pt'
+    # prepare model and input datas
+    create_equal_model(model_path)
+    # Use nonzero values so that inputs have the same truthiness but different values
+    input1_data = np.random.randint(1, 5, input_shape)
+    for dtype in ('float32', 'int32'):
+        input1_data = input1_data.astype(dtype)
+        for input2_data in (input1_data.copy(), (input1_data + 1).astype(dtype)):
+            feed_dict = {'x1': input1_data, 'x2': input2_data}
+            exit_status = run_parser(model_path, feed_dict)
+            assert exit_status
@@ -0,0 +1,67 @@
+# SPDX-License-Identifier: Apache-2.0
+# Copyright © 2022-2024 Arm Technology (China) Co. Ltd.
+
+
+import os
+import onnx
+import torch
+import torch.nn as nn
+import numpy as np
+from utils.run import run_parser
+
+
+class quantize_cat_model(nn.Module):
+    def __init__(self, scale_1, zero_point_1):
+        super(quantize_cat_model, self).__init__()
+        self.scale_1 = scale_1
+        self.zero_point_1 = zero_point_1
+
+    def forward(self, x1, x2):
+        q_input1 = torch.quantize_per_tensor(x1, scale=0.5, zero_point=12, dtype=torch.quint8)
+        q_input2 = torch.quantize_per_tensor(x2, scale=self.scale_1, zero_point=self.zero_point_1,
+                                             dtype=torch.quint8)
+        return torch.ops.quantized.cat([q_input1, q_input2], dim=1, scale=0.5, zero_point=12)
+
+
+def create_quantize_cat_model(model_path, scale_1, zero_point_1):
+    try:
+        model = quantize_cat_model(scale_1, zero_point_1)
+        model_scripted = torch.jit.script(model)
+        model_scripted.save(model_path)
+    except Exception as e:
+        print('Fail to create torch model because %s' % str(e))
+
+
+TEST_NAME = 'quantize_cat'
+input_shape1 = [2, 3, 10, 12]
+input_shape2 = [2, 5, 10, 12]
+
+# The first case has the same scale/zp for all the inputs and output
+for idx, (scale_1, zero_point_1) in enumerate([(0.5, 12), (0.2, 3)]):
+    model_path = '-'.join([TEST_NAME, str(idx)]) + '.pt'
+    # prepare model and input datas
+    x1_data = np.random.randint(-6, 64, input_shape1).astype(np.float32)
+    x2_data = np.random.randint(-6, 64, input_shape2).astype(np.float32)
+    feed_dict = {'x1': x1_data, 'x2': x2_data}
+    create_quantize_cat_model(model_path, scale_1, zero_point_1)
+    # need qtlib to generate ir before opt forward
+    if idx == 0:
+        exit_status = run_parser(model_path, feed_dict, verify=False,
+                                 expected_keywords=['quantize_zp_type=uint8'],
+                                 unexpected_keywords=['layer_type=DeQuantize'])
+    else:
+        exit_status = run_parser(model_path, feed_dict, verify=False,
+                                 expected_keywords=['quantize_zp_type=uint8'])
+    assert exit_status
+    # Check the onnx model exported from torch to make sure which path is used
+    onnx_model = onnx.load(os.path.join('output_dir', model_path + '.onnx'))
+    op_types = [node.op_type for node in onnx_model.graph.node]
+    if idx == 0:
+        # QLinearConcat without DequantizeLinear/QuantizeLinear around it
+        assert 'QLinearConcat' in op_types and 'Concat' not in op_types
+        assert 'DequantizeLinear' not in op_types
+        assert op_types.count('QuantizeLinear') == 2
+    else:
+        # Fall back to DequantizeLinear+Concat+QuantizeLinear
+        assert 'QLinearConcat' not in op_types
+        assert 'DequantizeLinear' in op_types and 'Concat' in op_types